@@ -2,7 +2,8 @@
 import pyhop
 import domain  # import our domain (operators, methods)
 
-def main():
+def build():
+    """Return the initial state and the tasks of this problem."""
     # Our world
     state0 = pyhop.State('initial_state')
     
@@ -76,6 +77,11 @@ def main():
         
     ]
 
+    return state0, tasks
+
+def main():
+    state0, tasks = build()
+
     goal1 = pyhop.Goal('goal1')
     goal1.tasks = tasks
 
@@ -1,152 +1,350 @@
 # domain.py
+import math
 import pyhop
-from collections import deque
+from collections import OrderedDict, deque
 from heapq import heappush, heappop
 
 # Constantes de coste
 COST_WALK = 1
 COST_BUS = 3
 
-def find_path_with_modes(state, graph, start, goal):
+class CostModel:
+    """
+    Modelo de costes de los desplazamientos de los conductores.
+    - walk, bus: coste de un tramo a pie o en bus (por defecto, COST_WALK
+      y COST_BUS en el momento de crearlo)
+    - edges: costes de tramos concretos, {(desde, hasta, modo): coste};
+      el tramo desde -> hasta es distinto del tramo hasta -> desde
+    Se pasa en cada llamada a PyHop, por ejemplo
+    pyhop.pyhop(state, tasks, params={'cost_model': CostModel(bus=0)}).
+    Es inmutable: su clave y su hash se calculan una vez, al crearlo, porque
+    las tablas de rutas lo buscan en cada expansión.
+    """
+
+    def __init__(self, walk=None, bus=None, edges=None):
+        walk = COST_WALK if walk is None else walk
+        bus = COST_BUS if bus is None else bus
+        edges = pyhop.rigid(dict(edges or {}))
+        key = (walk, bus, frozenset(edges.items()))
+        for name, value in (('walk', walk), ('bus', bus), ('edges', edges),
+                            ('_key', key), ('_hash', hash(key))):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise TypeError("CostModel es inmutable: crea otro")
+
+    def cost(self, mode, city_from, city_to):
+        """Coste de ir de city_from a city_to en modo 'walk' o 'bus'."""
+        default = self.walk if mode == 'walk' else self.bus
+        if not self.edges:
+            return default
+        return self.edges.get((city_from, city_to, mode), default)
+
+    def __eq__(self, other):
+        return isinstance(other, CostModel) and self._key == other._key
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return f"CostModel(walk={self.walk!r}, bus={self.bus!r}, edges={self.edges!r})"
+
+# Modelos sin param cost_model, por (COST_WALK, COST_BUS): se piden varias
+# veces en cada nodo y crear uno cuesta más que buscarlo aquí
+DEFAULT_MODELS = {}
+
+def cost_model():
+    """
+    Modelo de costes del planner que está buscando: su param cost_model o,
+    si no lo tiene, sus params COST_WALK y COST_BUS (por defecto, las
+    constantes del módulo).
+    """
+    params = pyhop.active_params()
+    model = params.get('cost_model')
+    if model is None:
+        costs = (params.get('COST_WALK', COST_WALK), params.get('COST_BUS', COST_BUS))
+        model = DEFAULT_MODELS.get(costs)
+        if model is None:
+            model = DEFAULT_MODELS[costs] = CostModel(*costs)
+    return model
+
+def find_path_with_modes(state, graph, start, goal, budget=None):
     """
     Busca la ruta desde start hasta goal considerando dos modos para cada conexión.
-    Cada arista se puede transitar caminando (coste COST_WALK) o en bus (coste COST_BUS).
+    Cada arista se puede transitar caminando o en bus, con los costes de cost_model().
     Devuelve una lista de pasos: cada paso es una tupla (nodo_actual, nodo_siguiente, modo)
-    que representa la acción recomendada para minimizar el coste sin exceder state.limit_cost.
+    que representa la acción recomendada para minimizar el coste sin exceder budget
+    (por defecto, lo que queda de presupuesto: state.limit_cost - state.cost).
     Si no existe ruta válida, retorna None.
     
     Variable graph es footmap!!!!
     """
     # Inicializamos la frontera como una cola de prioridad
-    # Cada elemento de la cola es una tupla:
-    #   (coste_acumulado, nodo_actual, ruta)
-    # donde "ruta" es una lista de pasos, y cada paso es (de, a, bus/walk)
+    # Cada elemento de la cola es una tupla (coste_acumulado, nodo_actual)
     frontier = [] #lista de tuplas
-    #               coste  start  modos
-    heappush(frontier, (0, start, []))
+    #               coste  start
+    heappush(frontier, (0, start))
+    model = cost_model()
+    if budget is None:
+        budget = state.limit_cost - state.cost
     
     # Guardamos en "best" el coste minimo con que se ha alcanzado cada nodo
     best = {start: 0}
+    # y en "parent" de dónde y cómo se llega a él por ese camino: (nodo_anterior, modo)
+    parent = {}
 
     """EJEMPLO:
     method instance ('move_driver', 'D1', 'C0')
-    [(0, 'C1', [])] ##apilamos el principio: estamos donde empezamos, no nos movemos
-    [] # desapilamos y sacamos los vecinos de C1
-    [(1, 'P_01', [('C1', 'P_01', 'walk')]), (1, 'P_12', [('C1', 'P_12', 'walk')])]
-    [(1, 'P_12', [('C1', 'P_12', 'walk')])]
-    [(1, 'P_12', [('C1', 'P_12', 'walk')]), (2, 'C0', [('C1', 'P_01', 'walk'), ('P_01', 'C0', 'walk')])]
-    [(2, 'C0', [('C1', 'P_01', 'walk'), ('P_01', 'C0', 'walk')])]
-    [(2, 'C0', [('C1', 'P_01', 'walk'), ('P_01', 'C0', 'walk')]), (2, 'C2', [('C1', 'P_12', 'walk'), ('P_12', 'C2', 'walk')])]
-    [(2, 'C2', [('C1', 'P_12', 'walk'), ('P_12', 'C2', 'walk')])]
+    frontera [(0, 'C1')]                 ##apilamos el principio: estamos donde empezamos
+    desapilamos C1 y miramos sus vecinos P_01 y P_12
+    frontera [(1, 'P_01'), (1, 'P_12')]  parent: P_01 <- (C1, walk), P_12 <- (C1, walk)
+    desapilamos P_01 y miramos sus vecinos C0 y C1
+    frontera [(1, 'P_12'), (2, 'C0')]    parent: C0 <- (P_01, walk)
+    desapilamos P_12: ...; desapilamos C0, que es la meta:
+    ruta C0 <- P_01 <- C1 = [('C1', 'P_01', 'walk'), ('P_01', 'C0', 'walk')]
     """
     
     while frontier:
-        print(frontier)
-        cost, current, path = heappop(frontier)
-        print(frontier)
+        cost, current = heappop(frontier)
         
-        # Si hemos llegado a la meta, devolvemos la ruta (lista de pasos)
+        # Si hemos llegado a la meta, reconstruimos la ruta (lista de pasos) hacia atrás
         if current == goal:
+            path = []
+            while current != start:
+                previous, mode = parent[current]
+                path.append((previous, current, mode))
+                current = previous
+            path.reverse()
             return path
         
+        # Entrada antigua: ya se llegó a este nodo por un camino más barato
+        if cost > best[current]:
+            continue
+        
         # Para cada vecino del nodo actual (miro grafo footmap)
         for neighbor in graph.get(current, []):
-            # --- Opción 1: transitar caminando ---
-            new_cost = cost + COST_WALK
-            # Solo consideramos esta opción si no se excede el límite
-            if new_cost <= state.limit_cost:
-                # Si este vecino no se ha alcanzado antes o se alcanza con menor coste, actualizamos:
-                if neighbor not in best or new_cost < best[neighbor]:
-                    best[neighbor] = new_cost
-                    heappush(frontier, (new_cost, neighbor, path + [(current, neighbor, 'walk')]))
-            
-            # --- Opción 2: transitar en bus ---
-            new_cost = cost + COST_BUS
-            if new_cost <= state.limit_cost:
-                if neighbor not in best or new_cost < best[neighbor]:
-                    best[neighbor] = new_cost
-                    heappush(frontier, (new_cost, neighbor, path + [(current, neighbor, 'bus')]))
+            # --- Opción 1: transitar caminando; Opción 2: transitar en bus ---
+            for mode in ('walk', 'bus'):
+                new_cost = cost + model.cost(mode, current, neighbor)
+                # Solo consideramos esta opción si no se excede el presupuesto
+                if new_cost <= budget:
+                    # Si este vecino no se ha alcanzado antes o se alcanza con menor coste, actualizamos:
+                    if neighbor not in best or new_cost < best[neighbor]:
+                        best[neighbor] = new_cost
+                        parent[neighbor] = (current, mode)
+                        heappush(frontier, (new_cost, neighbor))
     
     # Si se termina la exploración sin llegar a la meta, devolvemos None
     return None
 
+##################################################
+# Tabla de rutas del footmap
+
+class RoutingTable:
+    """
+    Rutas más baratas entre cada par de nodos del footmap con un modelo de
+    costes: para (origen, destino), el coste total y el primer tramo
+    (siguiente nodo, modo). Las filas de cada origen se calculan la primera
+    vez que se piden, con un Dijkstra que desempata igual que
+    find_path_with_modes, así que el primer tramo es el mismo que el suyo.
+    """
+
+    def __init__(self, graph, model):
+        # copia del mapa: las filas que falten se calculan sobre este contenido
+        self.graph = {node: tuple(neighbors) for node, neighbors in graph.items()}
+        self.model = model
+        self.rows = {}
+
+    def route(self, start, goal, budget=math.inf):
+        """
+        Devuelve (coste, siguiente nodo, modo) de start a goal, o None si no
+        hay camino o si el más barato cuesta más que budget.
+        """
+        row = self.rows.get(start)
+        if row is None:
+            row = self.rows[start] = self._row(start)
+        route = row.get(goal)
+        if route is None or route[0] > budget:
+            return None
+        return route
+
+    def _row(self, start):
+        # Como en find_path_with_modes, pero sin parar en una meta y
+        # guardando solo el primer tramo de cada ruta
+        graph, model = self.graph, self.model
+        frontier = [(0, start, None)]
+        best = {start: 0}
+        row = {}
+        while frontier:
+            cost, current, first = heappop(frontier)
+            if current in row:
+                continue
+            row[current] = (cost,) + (first or (None, None))
+            for neighbor in graph.get(current, []):
+                for mode in ('walk', 'bus'):
+                    new_cost = cost + model.cost(mode, current, neighbor)
+                    if neighbor not in best or new_cost < best[neighbor]:
+                        best[neighbor] = new_cost
+                        heappush(frontier, (new_cost, neighbor, first or (neighbor, mode)))
+        return row
+
+# Tablas de rutas ya calculadas, por contenido del mapa y modelo de costes
+ROUTING_TABLES = OrderedDict()
+ROUTING_TABLES_MAX = 64
+
+def map_version(graph):
+    """
+    Código del contenido de graph: cambia si el mapa cambia (se sustituye
+    un valor de state.footmap, o state.footmap entero).
+    """
+    if isinstance(graph, pyhop.CowDict):
+        return graph.content_hash()
+    try:
+        return hash(graph)  # mapas rígidos (pyhop.rigid)
+    except TypeError:
+        return hash(tuple((node, tuple(neighbors)) for node, neighbors in graph.items()))
+
+def routing_table(graph):
+    """Tabla de rutas de graph con el modelo de costes activo, reutilizada mientras no cambien."""
+    key = (map_version(graph), cost_model())
+    table = ROUTING_TABLES.get(key)
+    if table is None:
+        table = ROUTING_TABLES[key] = RoutingTable(graph, key[1])
+        if len(ROUTING_TABLES) > ROUTING_TABLES_MAX:
+            ROUTING_TABLES.popitem(last=False)
+    return table
+
+##################################################
+# Tabla de rutas del roadmap
+
+class HopTable:
+    """
+    Rutas con menos tramos entre cada par de ciudades del roadmap: para
+    (origen, destino), el número de tramos y la primera ciudad del camino.
+    Conducir no cuesta nada, así que basta un BFS (sin pesos) desde cada
+    origen, calculado la primera vez que se pide. Entre rutas igual de
+    cortas gana la que sale por el primer vecino de la lista.
+    """
+
+    def __init__(self, graph):
+        # copia del mapa, como en RoutingTable
+        self.graph = {city: tuple(neighbors) for city, neighbors in graph.items()}
+        self.rows = {}
+
+    def route(self, start, goal):
+        """Devuelve (tramos, siguiente ciudad) de start a goal, o None si no hay camino."""
+        row = self.rows.get(start)
+        if row is None:
+            row = self.rows[start] = self._row(start)
+        return row.get(goal)
+
+    def _row(self, start):
+        row = {start: (0, None)}
+        frontier = deque([start])
+        while frontier:
+            current = frontier.popleft()
+            hops, first = row[current]
+            for neighbor in self.graph.get(current, []):
+                if neighbor not in row:
+                    row[neighbor] = (hops + 1, first or neighbor)
+                    frontier.append(neighbor)
+        return row
+
+# Tablas de rutas del roadmap ya calculadas, por contenido del mapa
+HOP_TABLES = OrderedDict()
+
+def hop_table(graph):
+    """Tabla de rutas de graph, reutilizada mientras el mapa no cambie."""
+    key = map_version(graph)
+    table = HOP_TABLES.get(key)
+    if table is None:
+        table = HOP_TABLES[key] = HopTable(graph)
+        if len(HOP_TABLES) > ROUTING_TABLES_MAX:
+            HOP_TABLES.popitem(last=False)
+    return table
+
 ##################################################
 # Definición de Operadores
+# Cada operador se define con su precondición (pre) y sus efectos (eff).
+# Ambos se evalúan sobre el estado sin modificar, así PyHop solo copia
+# el estado cuando el operador es aplicable.
+
+def assign_driver_pre(state, driver, truck):
+    return state.loc[driver] == state.loc[truck] and state.driver_of[truck] is None
+
+def assign_driver_eff(state, driver, truck):
+    return [('driver_of', truck, driver)]
+
+assign_driver_op = pyhop.Operator('assign_driver_op', assign_driver_pre, assign_driver_eff)
+
+def remove_driver_pre(state, driver, truck):
+    return state.driver_of[truck] == driver and state.loc[driver] == state.loc[truck]
 
-def assign_driver_op(state, driver, truck):
-    if state.loc[driver] == state.loc[truck] and state.driver_of[truck] is None:
-        state.driver_of[truck] = driver
-        return state
-    return False
+def remove_driver_eff(state, driver, truck):
+    return [('driver_of', truck, None)]
 
-def remove_driver_op(state, driver, truck):
-    if state.driver_of[truck] == driver and state.loc[driver] == state.loc[truck]:
-        state.driver_of[truck] = None
-        return state
-    return False
+remove_driver_op = pyhop.Operator('remove_driver_op', remove_driver_pre, remove_driver_eff)
 
-def drive_truck_op(state, truck, city_from, city_to):
+def drive_truck_pre(state, truck, city_from, city_to):
     driver = state.driver_of[truck]
-    if driver is not None:
-        # Comprobamos ubicaciones y carreteras
-        if (state.loc[truck] == city_from and 
+    # Comprobamos conductor, ubicaciones y carreteras
+    return (driver is not None and
+            state.loc[truck] == city_from and 
             state.loc[driver] == city_from and 
-            city_to in state.roadmap[city_from]):
-            # Actualizamos ubicación
-            state.loc[truck] = city_to
-            state.loc[driver] = city_to
-            return state
-    return False
-
-def walk_op(state, driver, city_from, city_to):
-    if state.loc[driver] == city_from and city_to in state.footmap[city_from]:
-         if state.cost + COST_WALK > state.limit_cost:
-             return False  # No se permite exceder el coste
-         state.loc[driver] = city_to
-         state.cost += COST_WALK
-         return state
-    return False
-
-def bus_op(state, driver, city_from, city_to):
-    if state.loc[driver] == city_from and city_to in state.footmap[city_from]:
-         if state.cost + COST_BUS > state.limit_cost:
-             return False  # No se permite exceder el coste
-         state.loc[driver] = city_to
-         state.cost += COST_BUS
-         return state
-    return False
-
-def load_op(state, package, truck):
+            city_to in state.roadmap[city_from])
+
+def drive_truck_eff(state, truck, city_from, city_to):
+    # Actualizamos ubicación del camión y de su conductor
+    return [('loc', truck, city_to), ('loc', state.driver_of[truck], city_to)]
+
+drive_truck_op = pyhop.Operator('drive_truck_op', drive_truck_pre, drive_truck_eff)
+
+def walk_pre(state, driver, city_from, city_to):
+    return (state.loc[driver] == city_from and city_to in state.footmap[city_from] and
+            state.cost + cost_model().cost('walk', city_from, city_to) <= state.limit_cost)  # No se permite exceder el coste
+
+def walk_eff(state, driver, city_from, city_to):
+    return [('loc', driver, city_to), ('cost', state.cost + cost_model().cost('walk', city_from, city_to))]
+
+walk_op = pyhop.Operator('walk_op', walk_pre, walk_eff)
+
+def bus_pre(state, driver, city_from, city_to):
+    return (state.loc[driver] == city_from and city_to in state.footmap[city_from] and
+            state.cost + cost_model().cost('bus', city_from, city_to) <= state.limit_cost)  # No se permite exceder el coste
+
+def bus_eff(state, driver, city_from, city_to):
+    return [('loc', driver, city_to), ('cost', state.cost + cost_model().cost('bus', city_from, city_to))]
+
+bus_op = pyhop.Operator('bus_op', bus_pre, bus_eff)
+
+def load_pre(state, package, truck):
     driver = state.driver_of[truck]
-    if (state.loc[package] == state.loc[truck] and 
-        driver is not None and 
-        state.loc[driver] == state.loc[truck] and
-        state.pack_in[package] is None):
-        state.pack_in[package] = truck
-        return state
-    return False
-
-def unload_op(state, package, truck):
+    return (state.loc[package] == state.loc[truck] and 
+            driver is not None and 
+            state.loc[driver] == state.loc[truck] and
+            state.pack_in[package] is None)
+
+def load_eff(state, package, truck):
+    return [('pack_in', package, truck)]
+
+load_op = pyhop.Operator('load_op', load_pre, load_eff)
+
+def unload_pre(state, package, truck):
     driver = state.driver_of[truck]
-    if (state.pack_in[package] == truck and
-        state.loc[truck] == state.loc[driver] and
-        state.driver_of[truck] is not None):
-        # El paquete pasa a estar en la ciudad del camión
-        city = state.loc[truck]
-        state.loc[package] = city
-        state.pack_in[package] = None
-        return state
-    return False
-
-def update_final_cost(state, cost):
-    state.limit_cost = cost # establecemos nuestra variable coste limite
-    return state
-
-# Declarar operadores
-pyhop.declare_operators(
-    assign_driver_op, remove_driver_op, drive_truck_op, 
-    walk_op, bus_op, load_op, unload_op, update_final_cost
-)
+    return (state.pack_in[package] == truck and
+            state.loc[truck] == state.loc[driver] and
+            state.driver_of[truck] is not None)
+
+def unload_eff(state, package, truck):
+    # El paquete pasa a estar en la ciudad del camión
+    return [('loc', package, state.loc[truck]), ('pack_in', package, None)]
+
+unload_op = pyhop.Operator('unload_op', unload_pre, unload_eff)
+
+def update_final_cost_eff(state, cost):
+    return [('limit_cost', cost)] # establecemos nuestra variable coste limite
+
+update_final_cost = pyhop.Operator('update_final_cost', None, update_final_cost_eff)
 
 ##################################################
 # Definición de Métodos
@@ -184,21 +382,20 @@ def method_move_truck(state, truck, city_dest):
             # Si no se encuentra ningún conductor disponible, fallamos.
             return False
     
-    # Si el camión ya tiene conductor, procedemos a moverlo.
-    # Comprobamos si el destino es alcanzable en un solo salto.
-    if city_dest in state.roadmap[city_truck]:
-        # Movimiento directo.
-        return [('drive_truck_op', truck, city_truck, city_dest)]
-    else:
-        # Se requiere pasar por una ciudad intermedia.
-        # Elegimos (por ejemplo) la primera ciudad vecina y actuamos de forma recursiva.
-        for city_next in state.roadmap[city_truck]:
-            return [
-                ('drive_truck_op', truck, city_truck, city_next),
-                ('move_truck', truck, city_dest)
-            ]
-        # En caso poco probable de que no haya vecinos, fallamos.
-        return False
+    # Si el camión ya tiene conductor, procedemos a moverlo: emitimos de
+    # una vez todos los tramos de la ruta más corta, de la tabla de rutas
+    # del roadmap (un solo tramo si el destino es vecino).
+    routes = hop_table(state.roadmap)
+    if routes.route(city_truck, city_dest) is None:
+        return False  # Destino inalcanzable por carretera
+    drives = []
+    current = city_truck
+    while current != city_dest:
+        # Los tramos que faltan bajan en uno a cada paso: no hay ciclos
+        city_next = routes.route(current, city_dest)[1]
+        drives.append(('drive_truck_op', truck, current, city_next))
+        current = city_next
+    return drives
  
 def method_move_driver(state, driver, city_dest):
     location = state.loc[driver]
@@ -220,21 +417,33 @@ def method_move_driver(state, driver, city_dest):
     if truck is not None:
         removal_step = [('remove_driver_op', driver, truck)]
     
-    # Usamos la función para obtener la ruta óptima con modos
-    route = find_path_with_modes(state, state.footmap, location, city_dest)
-    if not route or len(route) == 0:
-        return False  # No existe ruta válida
+    # Ruta óptima con modos, de la tabla de rutas del footmap: la misma
+    # que daría find_path_with_modes, sin buscarla de nuevo en cada tramo.
+    # Si ni la más barata cabe en lo que queda de presupuesto, ningún
+    # orden de tramos llegará: la rama muere aquí y no tras varios tramos
+    routes = routing_table(state.footmap)
+    if routes.route(location, city_dest, state.limit_cost - state.cost) is None:
+        return False  # No existe ruta asequible
     
-    # Tomamos el primer tramo de la ruta
-    first_step = route[0]  # (location, next_loc, mode)
-    _, next_loc, mode = first_step
-    if mode == 'bus':
-        move_op = ('bus_op', driver, location, next_loc)
-    else:
-        move_op = ('walk_op', driver, location, next_loc)
+    # Emitimos de una vez todos los tramos hasta city_dest, siguiendo el
+    # primer tramo de la ruta desde cada nodo (su coste ya cabe)
+    moves = []
+    seen = {location}
+    current = location
+    while current != city_dest:
+        _, next_loc, mode = routes.route(current, city_dest)
+        if next_loc in seen:
+            # Con tramos de coste 0 dos rutas igual de baratas pueden mandarse
+            # la una a la otra: el resto lo sacamos de un único camino
+            rest = find_path_with_modes(state, state.footmap, current, city_dest, math.inf)
+            moves.extend(('bus_op' if mode == 'bus' else 'walk_op', driver, city_from, city_to)
+                         for city_from, city_to, mode in rest)
+            break
+        moves.append(('bus_op' if mode == 'bus' else 'walk_op', driver, current, next_loc))
+        seen.add(next_loc)
+        current = next_loc
     
-    # Continuamos de forma recursiva hasta llegar a city_dest
-    return removal_step + [move_op, ('move_driver', driver, city_dest)]
+    return removal_step + moves
 
 def method_transport_package(state, package, city_dest):
     current_city = state.loc[package]
@@ -339,11 +548,71 @@ def method_transport_package(state, package, city_dest):
             # Hemos llegado al destino, descargamos el paquete
             return [('unload_op', package, truck_carrying)]
 
-# Declarar métodos en PyHop
-pyhop.declare_methods('move_truck', method_move_truck)
-pyhop.declare_methods('move_driver', method_move_driver)
-pyhop.declare_methods('transport_package', method_transport_package)
-pyhop.declare_methods('final_cost', method_final_cost)
+##################################################
+# Cota inferior del coste restante
+
+# Operadores que no mueven a ningún conductor: la cota sigue tras ellos.
+# Cualquier otra tarea puede mover camiones (y con ellos a sus conductores)
+# o cambiar el límite de coste, así que ahí paramos.
+TASKS_KEEP_DRIVERS = ('assign_driver_op', 'remove_driver_op', 'load_op', 'unload_op')
+
+def remaining_cost_bound(state, tasks):
+    """
+    Cota inferior del coste final de cualquier plan para las tareas
+    pendientes: state.cost más lo que cuestan los desplazamientos a pie o
+    en bus del principio de la agenda. Cada move_driver cuesta al menos
+    el camino más barato hasta su destino, tramo a tramo por el modo más
+    barato.
+    Recorremos la agenda siguiendo la posición de cada conductor y paramos
+    en la primera tarea que pueda mover camiones (y con ellos conductores).
+    Sumar todos los move_driver pendientes no sería una cota válida, porque
+    un conductor puede llegar a su destino conduciendo un camión.
+    Devuelve math.inf si el plan no puede caber en state.limit_cost.
+    """
+    model = cost_model()
+    routes = routing_table(state.footmap)
+    total = state.cost
+    position = {}
+    for task in tasks:
+        name = task[0]
+        if name == 'move_driver':
+            driver, city_dest = task[1], task[2]
+            location = position.get(driver, state.loc[driver])
+            route = routes.route(location, city_dest)
+            if route is None:
+                return math.inf
+            total += route[0]
+            position[driver] = city_dest
+        elif name == 'walk_op':
+            total += model.cost('walk', task[2], task[3])
+            position[task[1]] = task[3]
+        elif name == 'bus_op':
+            total += model.cost('bus', task[2], task[3])
+            position[task[1]] = task[3]
+        elif name not in TASKS_KEEP_DRIVERS:
+            break
+    if total > getattr(state, 'limit_cost', math.inf):
+        return math.inf
+    return total
+
+##################################################
+# Declaración del dominio
+
+def register(planner):
+    """Declara los operadores, métodos y la cota inferior de este dominio en planner."""
+    planner.declare_operators(
+        assign_driver_op, remove_driver_op, drive_truck_op, 
+        walk_op, bus_op, load_op, unload_op, update_final_cost
+    )
+    planner.declare_methods('move_truck', method_move_truck)
+    planner.declare_methods('move_driver', method_move_driver)
+    planner.declare_methods('transport_package', method_transport_package)
+    planner.declare_methods('final_cost', method_final_cost)
+    planner.declare_lower_bound(remaining_cost_bound)
+    return planner
+
+# Declarar el dominio en el planner por defecto de PyHop
+register(pyhop.default_planner)
 
 # Imprimir operadores y métodos para verificación
 if __name__ == '__main__':
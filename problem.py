@@ -2,7 +2,8 @@
 import pyhop
 import domain  # import our domain (operators, methods)
 
-def main():
+def build():
+    """Return the initial state and the tasks of this problem."""
     # Our world
     state0 = pyhop.State('initial_state')
     
@@ -55,6 +56,9 @@ def main():
 
     state0.cost = 0
 
+    # Objects and maps never change while planning: share them, never copy them
+    pyhop.declare_rigid(state0, 'cities', 'drivers', 'trucks', 'packages', 'roadmap', 'footmap')
+
     # Goals (HTN - Hierarchical Task Network) == tasks to do
     # example:
     # GOAL
@@ -66,6 +70,11 @@ def main():
         ('move_driver', 'D1', 'C0'),       #  - move D1 to C0
     ]
 
+    return state0, tasks
+
+def main():
+    state0, tasks = build()
+
     goal1 = pyhop.Goal('goal1')
     goal1.tasks = tasks
 
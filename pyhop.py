@@ -30,11 +30,39 @@ Pyhop provides the following classes and functions:
   To put variables and values into it, you should do assignments such as
   foo.var1 = val1
 
+- foo.copy() returns a copy-on-write child of the state foo: the child
+  shares foo's dictionaries and only clones one (e.g. foo.loc) the first
+  time it is written to. List and set variables are copied (shallowly),
+  immutable and rigid values are shared, and any other value is
+  deep-copied. Planning copies states this way, so values nested inside
+  a dict, list or set must be replaced (foo.m[k] = new), not mutated.
+
+- rigid(value) returns a frozen copy of value (dicts, lists and sets inside
+  it are frozen too) and declare_rigid(foo, 'v1', 'v2', ...) freezes the
+  variables foo.v1, foo.v2, ... in place. Rigid values are data that never
+  change during planning, such as maps: they are shared by reference by
+  all copies of the state, never copied, and raise TypeError if modified.
+
+- compile_state(foo) returns a copy of foo whose dict variables with
+  hashable values (e.g. foo.loc) are stored compactly: keys and values
+  are interned to small integers once per problem and each dict becomes
+  an array of integers, so copying one is a single memory copy. Domain
+  code keeps using foo.loc['b'] as before.
+
+- States can be hashed and compared: two states are equal when all their
+  variables are equal. The hash is updated in O(1) on each write, e.g.
+  foo.loc['b'] = 'r2', so hash(foo) stays cheap during planning.
+
 - bar = Goal('bar') tells Pyhop to create an empty goal object named 'bar'.
   To put variables and values into it, you should do assignments such as
   bar.var1 = val1
 
 - print_state(foo) will print the variables and values in the state foo.
+  print_state(foo, diff=changes) and to_string(foo, diff=changes) show
+  only the changes an operator made, e.g. foo.loc['b']: 'r1' -> 'r2'.
+  Trace events for operators carry these changes (event.changes), and
+  pyhop(state1,tasklist,trace=PrintSink(3, diff=True)) prints verbose = 3
+  output with only the changes instead of each whole new state.
 
 - print_goal(foo) will print the variables and values in the goal foo.
 
@@ -42,6 +70,13 @@ Pyhop provides the following classes and functions:
   are all of the planning operators; this supersedes any previous call
   to declare_operators.
 
+- Operator('op', pre, effects) is an operator written declaratively:
+  pre(state, *args) tells whether it applies and effects(state, *args)
+  returns the assignments it makes, as (var, value) for state.var = value
+  or (var, key, value) for state.var[key] = value. Both are evaluated on
+  the unmodified state, so the planner copies the state only when the
+  precondition holds. Operators can be declared either way.
+
 - print_operators() will print out the list of available operators.
 
 - declare_methods('foo', m1, m2, ..., mk) tells Pyhop that m1, m2, ..., mk
@@ -50,6 +85,19 @@ Pyhop provides the following classes and functions:
 
 - print_methods() will print out a list of all declared methods.
 
+- Planner() is a planner with its own operators, methods, lower bound and
+  params; p.declare_operators(...), p.declare_methods(...) and p.pyhop(...)
+  work like the functions of the same name, which use default_planner.
+  p.variant(COST_BUS=0) is a copy of p with other params; domain code
+  reads the params of the planner running it with active_params().
+  pyhop(state1,tasklist,params={...}) overrides params for one call.
+
+- declare_lower_bound(f) tells Pyhop that f(state, tasks) never exceeds
+  the final cost of a plan for the remaining tasks, and is math.inf
+  when they cannot be accomplished. The search prunes nodes for which
+  it is math.inf, and when optimizing, nodes for which it reaches the
+  cost of the best plan so far.
+
 - pyhop(state1,tasklist) tells Pyhop to find a plan for accomplishing tasklist
   (a list of tasks), starting from an initial state state1, using whatever
   methods and operators you declared previously.
@@ -58,8 +106,74 @@ Pyhop provides the following classes and functions:
   'verbose' that tells pyhop how much debugging printout it should provide:
 - if verbose = 0 (the default), pyhop returns the solution but prints nothing;
 - if verbose = 1, it prints the initial parameters and the answer;
-- if verbose = 2, it also prints a message on each recursive call;
+- if verbose = 2, it also prints a message on each search node;
 - if verbose = 3, it also prints info about what it's computing.
+
+- pyhop(state1,tasklist,mode='trail') finds the same plan without copying
+  states: operators modify one state in place, every write is recorded on
+  an undo trail, and the trail is replayed backwards when the search
+  backtracks. Operators must then return the state they were given (or
+  False), and replace list and set variables (foo.v = foo.v + [x])
+  rather than change them in place, which the trail cannot undo.
+  The default mode='copy' gives each operator its own copy.
+
+- pyhop(state1,tasklist,table=TranspositionTable()) remembers every
+  (state, remaining tasks) pair that the search has proven to fail and
+  prunes it when it is reached again through other method choices.
+  The table keeps at most max_entries pairs (least recently used ones are
+  evicted) and can put a Bloom filter in front of its lookups.
+
+- pyhop(state1,tasklist,stats=SearchStats()) fills in the SearchStats
+  object with what the search did: nodes expanded, backtracks, maximum
+  depth, wall time, time spent copying states versus running domain code,
+  and how often each operator and method succeeded or failed.
+  stats.as_dict() gives them as a flat dict, e.g. for monitoring.
+
+- pyhop(state1,tasklist,optimize=True) does not stop at the first plan:
+  it keeps searching for cheaper ones, pruning every node whose
+  state1.cost already reaches the cost of the best plan found so far,
+  and returns the cheapest plan. optimize can also be a function
+  giving the cost of a state; costs must never decrease along a plan.
+  pyhop(state1,tasklist,deadline=t) stops searching after t seconds
+  and returns a BudgetExhausted (see below) holding the best plan found
+  by then, if any, so a timed-out result is never taken for a full one.
+  max_nodes=n does the same after n search nodes, and stop=f once the
+  function f, called every few nodes, returns true.
+
+- pyhop(state1,tasklist,workers=n) searches with n worker processes.
+  The search tree is split into work units, one subtree each: a worker
+  that runs out of work gets the shallowest untried alternatives of
+  a busy worker. The first plan found is returned and the other workers
+  are stopped. With deterministic=True, the plan returned is the one
+  the one-process search would find. Workers are started the default
+  multiprocessing way: where that is not fork (Windows, macOS), the
+  operators, methods and states must be picklable (e.g. functions of an
+  importable module) and the main script must start planning under
+  if __name__ == '__main__'. verbose = 2 or 3 messages are not printed.
+  An exception in a worker is raised again by pyhop, and a worker that
+  dies (e.g. killed for memory) makes pyhop raise RuntimeError.
+
+- await pyhop_async(state1,tasklist) plans in a worker thread so an
+  asyncio event loop keeps running. It takes a deadline in seconds and
+  budgets of search nodes (max_nodes) and memory (max_memory, in bytes
+  of resident memory gained since the call started; Linux only),
+  and stops when the asyncio task is cancelled. When it stops early it
+  returns a BudgetExhausted object, false like [], that tells why and
+  holds the SearchStats and the best plan found (if any).
+
+- plan_batch(problems, 'domain') solves many (state, tasklist) problems on
+  a pool of worker processes that each import the module 'domain' once,
+  and yields (index, result) pairs, in order or as they complete.
+  Problems are sent in chunks, and only a bounded number of chunks is
+  in flight at a time, so problems can come from a lazy iterator.
+
+- pyhop(state1,tasklist,trace=f) calls f(event) with a TraceEvent for each
+  step of the search: 'expand', 'operator' (applied or failed),
+  'decompose', 'method' (chosen or failed), 'backtrack', 'pruned' and
+  'solution'. Events only hold references; their text is built when
+  f asks for it (event.payload(), str(event)). JsonLinesSink writes
+  events to a file as buffered JSON lines, SamplingSink passes on a random
+  sample of them, and PrintSink prints them as verbose = 2 or 3 does.
 """
 
 # Pyhop's planning algorithm is very similar to the one in SHOP and JSHOP
@@ -100,24 +214,290 @@ Pyhop provides the following classes and functions:
 # or "import simple_travel_example".
 
 
+import asyncio
+import contextvars
 import copy
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import threading
+import traceback
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from queue import Empty
+from time import perf_counter
 
 
 ############################################################
 # States and goals
 
-def to_string(obj):
+# marks a variable or key that did not exist before a write
+_MISSING = object()
+
+_HASH_MASK = (1 << 64) - 1
+
+
+def to_string(obj, diff=None):
     if not obj:
         return "False"
+    if diff is not None:
+        return " ".join(f"{obj.__name__}.{_change_string(change)}" for change in diff)
     return " ".join(f"{obj.__name__}.{name} = {val}" for name, val in vars(obj).items() if name != '__name__')
 
 
+def _freeze(value):
+    """Return a hashable copy of value, turning dicts and lists into frozensets and tuples."""
+    if isinstance(value, (dict, CowDict)):
+        return frozenset((key, _freeze(val)) for key, val in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(val) for val in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(val) for val in value)
+    return value
+
+
+def _zobrist(key, value):
+    """
+    64-bit code of the binding key = value. The hash of a state or dict
+    is the XOR of the codes of its bindings, so a write changes it by
+    XOR-ing out the old code and XOR-ing in the new one.
+    """
+    try:
+        return hash((key, value)) & _HASH_MASK
+    except TypeError:
+        return hash((key, _freeze(value))) & _HASH_MASK
+
+
+class CowDict(MutableMapping):
+    """
+    Copy-on-write dictionary used for the dict variables of a State.
+    Copies of a state share the underlying dict until one of them writes
+    to it; only then is that dict cloned. Values are not copied, so nested
+    containers must be replaced (state.m[k] = new) rather than mutated.
+    Once content_hash() has been asked for, writes keep it up to date.
+    """
+
+    __slots__ = ('_data', '_owned', '_trail', '_hash')
+
+    def __init__(self, data=None, owned=True):
+        self._data = {} if data is None else data
+        self._owned = owned
+        self._trail = None
+        self._hash = None
+
+    def share(self):
+        """Return a new view on the same data; both views clone on write."""
+        self._owned = False
+        view = CowDict(self._data, False)
+        view._hash = self._hash
+        return view
+
+    def _own(self):
+        if not self._owned:
+            self._data = self._data.copy()
+            self._owned = True
+        return self._data
+
+    def content_hash(self):
+        """Return the 64-bit hash of the current items (see _zobrist)."""
+        if self._hash is None:
+            value = 0
+            for key, val in self._data.items():
+                value ^= _zobrist(key, val)
+            self._hash = value
+        return self._hash
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        data = self._data if self._owned else self._own()
+        if self._trail is not None or self._hash is not None:
+            old = data.get(key, _MISSING)
+            if self._trail is not None:
+                self._trail.append((self, key, old))
+            if self._hash is not None:
+                if old is not _MISSING:
+                    self._hash ^= _zobrist(key, old)
+                self._hash ^= _zobrist(key, value)
+        data[key] = value
+
+    def __delitem__(self, key):
+        data = self._data if self._owned else self._own()
+        if self._trail is not None:
+            self._trail.append((self, key, data[key]))
+        if self._hash is not None:
+            self._hash ^= _zobrist(key, data[key])
+        del data[key]
+
+    def _restore(self, key, old):
+        """Set key back to old (or remove it) without recording the write."""
+        data = self._own()
+        if self._hash is not None:
+            if key in data:
+                self._hash ^= _zobrist(key, data[key])
+            if old is not _MISSING:
+                self._hash ^= _zobrist(key, old)
+        if old is _MISSING:
+            del data[key]
+        else:
+            data[key] = old
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def copy(self):
+        return dict(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, CowDict):
+            if self._data is other._data:
+                return True
+            if (self._hash is not None and other._hash is not None
+                    and self._hash != other._hash):
+                return False
+            return self._data == other._data
+        return self._data == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def __deepcopy__(self, memo):
+        return CowDict(copy.deepcopy(self._data, memo))
+
+    def __reduce__(self):
+        return CowDict, (self._data,)
+
+
 class State:
-    """A state is just a collection of variable bindings."""
+    """
+    A state is just a collection of variable bindings.
+    States hash and compare by their variables (not by their name). The
+    hash is kept up to date on every write once it has been computed, so
+    hashing a state during search is cheap; a state that is still being
+    modified should be copied before it is used as a dict key.
+    """
+
+    # _trail and _hash are kept out of __dict__ so they are not variables
+    __slots__ = ('__dict__', '_trail', '_hash')
 
     def __init__(self, name):
+        self._trail = None
+        self._hash = None
         self.__name__ = name
 
+    def __setattr__(self, name, value):
+        if name in State.__slots__:
+            object.__setattr__(self, name, value)
+            return
+        # dict variables are wrapped so copies of the state can share them
+        if type(value) is dict:
+            value = CowDict(value)
+        fields = self.__dict__
+        if self._trail is not None or self._hash is not None:
+            old = fields.get(name, _MISSING)
+            if self._trail is not None:
+                self._trail.append((self, name, old))
+                if type(value) is CowDict:
+                    value._trail = self._trail
+            if self._hash is not None and name != '__name__':
+                if old is not _MISSING and type(old) is not CowDict:
+                    self._hash ^= _zobrist(name, old)
+                if type(value) is not CowDict:
+                    self._hash ^= _zobrist(name, value)
+        fields[name] = value
+
+    def _restore(self, name, old):
+        """Set variable name back to old (or remove it) without recording the write."""
+        fields = self.__dict__
+        if self._hash is not None and name != '__name__':
+            current = fields.get(name, _MISSING)
+            if current is not _MISSING and type(current) is not CowDict:
+                self._hash ^= _zobrist(name, current)
+            if old is not _MISSING and type(old) is not CowDict:
+                self._hash ^= _zobrist(name, old)
+        if old is _MISSING:
+            del fields[name]
+        else:
+            fields[name] = old
+
+    def copy(self):
+        """
+        Return a copy-on-write copy of this state (see CowDict). Lists and
+        sets are copied, values of _SHARED_TYPES shared, others deep-copied.
+        """
+        child = State.__new__(State)
+        child._trail = None
+        child._hash = self._hash
+        fields = child.__dict__
+        for name, val in self.__dict__.items():
+            kind = type(val)
+            if kind is CowDict:
+                val = val.share()
+            elif kind is list or kind is set:
+                val = kind(val)
+            elif kind not in _SHARED_TYPES:
+                val = copy.deepcopy(val)
+            fields[name] = val
+        return child
+
+    __copy__ = copy
+
+    def __hash__(self):
+        fields = self.__dict__
+        if self._hash is None:
+            # variables that are not dicts are hashed once, then updated on write
+            value = 0
+            for name, val in fields.items():
+                if name != '__name__' and type(val) is not CowDict:
+                    value ^= _zobrist(name, val)
+            self._hash = value
+        value = self._hash
+        for name, val in fields.items():
+            if type(val) is CowDict:
+                value ^= _zobrist(name, val.content_hash())
+        return value
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, State):
+            return NotImplemented
+        if hash(self) != hash(other):
+            return False
+        mine, theirs = self.__dict__, other.__dict__
+        if len(mine) - ('__name__' in mine) != len(theirs) - ('__name__' in theirs):
+            return False
+        for name, val in mine.items():
+            if name != '__name__' and (name not in theirs or not val == theirs[name]):
+                return False
+        return True
+
     def __str__(self):
         return to_string(self)
 
@@ -138,11 +518,73 @@ class Goal:
         return self.__str__()
 
 
+def set_trail(state, trail):
+    """
+    Record every later write to state, or to one of its dict variables,
+    on the list trail (None stops recording). See undo_trail.
+    """
+    state._trail = trail
+    for val in vars(state).values():
+        if type(val) is CowDict:
+            val._trail = trail
+
+
+def undo_trail(trail, mark):
+    """Undo the writes recorded on trail after position mark, newest first."""
+    while len(trail) > mark:
+        target, key, old = trail.pop()
+        target._restore(key, old)
+
+
+def state_changes(state, entries):
+    """
+    Turn undo trail entries recorded while writing to state into a list of
+    changes (name, key, old, new): key is _MISSING for a write to variable
+    name itself and old or new is _MISSING for a variable or key that did
+    not exist. Repeated writes are merged and writes that changed nothing
+    are dropped. Dict variables, including the compact ones of a compiled
+    state, are CowDicts, so their writes show up key by key; changes made
+    inside a container that is a value (state.m[k].append(x)) bypass the
+    trail and do not show up.
+    """
+    names = {id(val): name for name, val in vars(state).items() if type(val) is CowDict}
+    first = {}
+    for target, key, old in entries:
+        if target is state:
+            first.setdefault((key, _MISSING), old)
+        elif id(target) in names:
+            first.setdefault((names[id(target)], key), old)
+    changes = []
+    fields = vars(state)
+    for (name, key), old in first.items():
+        new = fields.get(name, _MISSING)
+        if key is not _MISSING:
+            new = new.get(key, _MISSING)
+        if new is not old and not new == old:
+            changes.append((name, key, old, new))
+    return changes
+
+
+def _change_string(change):
+    name, key, old, new = change
+    old = 'unset' if old is _MISSING else repr(old)
+    new = 'unset' if new is _MISSING else repr(new)
+    if key is _MISSING:
+        return f"{name}: {old} -> {new}"
+    return f"{name}[{key!r}]: {old} -> {new}"
+
+
 # print_state and print_goal are identical except for the name
 
-def print_state(state, indent=4):
-    """Print each variable in state, indented by indent spaces."""
-    if state:
+def print_state(state, indent=4, diff=None):
+    """
+    Print each variable in state, indented by indent spaces. With diff, a
+    list of changes (see state_changes), print only those changes.
+    """
+    if state and diff is not None:
+        for change in diff:
+            print(' ' * indent + f"{state.__name__}.{_change_string(change)}")
+    elif state:
         for name, val in vars(state).items():
             if name != '__name__':
                 print(' ' * indent + f"{state.__name__}.{name} = {val}")
@@ -160,6 +602,232 @@ def print_goal(goal, indent=4):
         print('False')
 
 
+############################################################
+# Rigid (static) data
+
+def _frozen(*args):
+    raise TypeError("rigid values cannot be modified")
+
+
+class FrozenDict(dict):
+    """A dict that cannot be modified. Its hash is computed once."""
+
+    __slots__ = ('_hash',)
+
+    __setitem__ = __delitem__ = __ior__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(frozenset(self.items()))
+            return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(tuple):
+    """A tuple that prints like a list, used for rigid lists."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return '[' + ', '.join(repr(item) for item in self) + ']'
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+# values that copies of a state can share: no write can change them
+_SHARED_TYPES = frozenset((type(None), bool, int, float, complex, str, bytes, tuple, frozenset,
+                           range, FrozenDict, FrozenList))
+
+
+def rigid(value):
+    """Return a frozen copy of value: dicts, lists and sets are frozen recursively."""
+    if isinstance(value, (FrozenDict, FrozenList, frozenset)):
+        return value
+    if isinstance(value, (dict, CowDict)):
+        return FrozenDict((key, rigid(val)) for key, val in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(rigid(val) for val in value)
+    if isinstance(value, set):
+        return frozenset(rigid(val) for val in value)
+    return value
+
+
+def declare_rigid(state, *names):
+    """
+    Freeze the variables names of state (see rigid). Call it once on the
+    initial state, for the variables that no operator changes.
+    """
+    for name in names:
+        setattr(state, name, rigid(getattr(state, name)))
+    return state
+
+
+############################################################
+# Compact states
+
+class Symbols:
+    """Interning table that gives each distinct value a small integer code."""
+
+    __slots__ = ('codes', 'values')
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        """Return the code of value, giving it a new one if it has none yet."""
+        # the type is part of the key so that 1, 1.0 and True stay apart
+        key = (value.__class__, value)
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class IndexedDict(MutableMapping):
+    """
+    Dictionary stored as an array of value codes (see Symbols) indexed by
+    key slot. The key -> slot layout and the symbols are shared by every
+    copy, so copy() only copies the array. A code of -1 is a missing key.
+    """
+
+    __slots__ = ('_slots', '_keys', '_symbols', '_codes', '_len')
+
+    def __init__(self, symbols=None, items=()):
+        self._slots = {}
+        self._keys = []
+        self._symbols = Symbols() if symbols is None else symbols
+        self._codes = array('i')
+        self._len = 0
+        for key, value in items:
+            self[key] = value
+
+    def copy(self):
+        clone = IndexedDict.__new__(IndexedDict)
+        clone._slots = self._slots
+        clone._keys = self._keys
+        clone._symbols = self._symbols
+        clone._codes = array('i', self._codes)
+        clone._len = self._len
+        return clone
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        # the codes stand for hashable, hence immutable, values
+        return self.copy()
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None and slot < len(self._codes):
+            code = self._codes[slot]
+            if code >= 0:
+                return self._symbols.values[code]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self._slots.get(key)
+        if slot is None:
+            # a new key gets a slot in the layout shared by all copies
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+        codes = self._codes
+        if slot >= len(codes):
+            codes.extend([-1] * (slot + 1 - len(codes)))
+        if codes[slot] < 0:
+            self._len += 1
+        codes[slot] = self._symbols.code(value)
+
+    def __delitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is None or slot >= len(self._codes) or self._codes[slot] < 0:
+            raise KeyError(key)
+        self._codes[slot] = -1
+        self._len -= 1
+
+    def __contains__(self, key):
+        slot = self._slots.get(key)
+        return slot is not None and slot < len(self._codes) and self._codes[slot] >= 0
+
+    def __iter__(self):
+        keys = self._keys
+        return (keys[slot] for slot, code in enumerate(self._codes) if code >= 0)
+
+    def __len__(self):
+        return self._len
+
+    def get(self, key, default=None):
+        slot = self._slots.get(key)
+        if slot is not None and slot < len(self._codes):
+            code = self._codes[slot]
+            if code >= 0:
+                return self._symbols.values[code]
+        return default
+
+    def values(self):
+        values = self._symbols.values
+        return [values[code] for code in self._codes if code >= 0]
+
+    def items(self):
+        keys, values = self._keys, self._symbols.values
+        return [(keys[slot], values[code]) for slot, code in enumerate(self._codes) if code >= 0]
+
+    def __eq__(self, other):
+        if (isinstance(other, IndexedDict) and other._slots is self._slots
+                and other._symbols is self._symbols):
+            mine, theirs = self._codes, other._codes
+            if len(mine) > len(theirs):
+                mine, theirs = theirs, mine
+            size = len(mine)
+            return mine == theirs[:size] and all(code < 0 for code in theirs[size:])
+        return MutableMapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def compile_state(state, fields=None, symbols=None):
+    """
+    Return a copy of state whose dict variables are IndexedDicts.
+    fields names the variables to convert; by default every dict variable
+    whose values are all hashable. symbols is the Symbols table to intern
+    into (by default a new one, shared by all the converted variables).
+    """
+    symbols = Symbols() if symbols is None else symbols
+    compact = state.copy()
+    for name, val in vars(state).items():
+        if type(val) is not CowDict:
+            continue
+        if fields is None:
+            try:
+                for value in val.values():
+                    hash(value)
+            except TypeError:
+                continue
+        elif name not in fields:
+            continue
+        setattr(compact, name, CowDict(IndexedDict(symbols, val.items())))
+    return compact
+
+
 ############################################################
 # Helper functions that may be useful in domain models
 
@@ -179,35 +847,183 @@ def find_if(cond, seq):
 ############################################################
 # Commands to tell Pyhop what the operators and methods are
 
-operators = {}
-methods = {}
+class Operator:
+    """
+    An operator given as a precondition and a list of effects.
+    - pre(state, *args) returns True if the operator applies (None means
+      it always applies);
+    - effects(state, *args) returns the assignments it makes, each one
+      either (var, value) or (var, key, value).
+    Neither may modify the state. Calling the operator works like calling
+    an ordinary operator function.
+    """
+
+    def __init__(self, name, pre, effects):
+        if not isinstance(name, str):
+            raise ValueError("Operator name must be a string")
+        if pre is not None and not callable(pre):
+            raise ValueError(f"Precondition {pre} is not callable")
+        if not callable(effects):
+            raise ValueError(f"Effects {effects} is not callable")
+        self.__name__ = name
+        self.pre = pre
+        self.effects = effects
 
+    def applicable(self, state, *args):
+        return self.pre is None or bool(self.pre(state, *args))
 
-def declare_operators(*op_list):
+    def __call__(self, state, *args):
+        if not self.applicable(state, *args):
+            return False
+        return apply_effects(state, self.effects(state, *args))
+
+    def __repr__(self):
+        return f"Operator({self.__name__!r})"
+
+
+def apply_effects(state, effects):
+    """Make the assignments effects (see Operator) in state and return state."""
+    for effect in effects:
+        if len(effect) == 2:
+            setattr(state, effect[0], effect[1])
+        else:
+            var, key, value = effect
+            getattr(state, var)[key] = value
+    return state
+
+
+class Planner:
     """
-    Call this after defining the operators, to tell Pyhop what they are.
-    op_list must be a list of functions, not strings.
+    A planner with its own operators, methods, lower bound and params (a
+    dict of domain constants, e.g. costs). Domain code reads the params
+    of the planner that is searching with active_params(), so several
+    planners, for variants of one domain, can search at the same time in
+    different threads. The module functions use default_planner.
     """
-    for op in op_list:
-        if not callable(op):
-            raise ValueError(f"Operator {op} is not callable")
-        operators[op.__name__] = op
-    return operators
+
+    def __init__(self, params=None):
+        self.operators = {}
+        self.methods = {}
+        self.lower_bound = None
+        self.params = dict(params or {})
+        self._lock = threading.Lock()
+
+    def variant(self, **params):
+        """Return a planner with the same operators and methods and params updated."""
+        with self._lock:
+            other = Planner({**self.params, **params})
+            other.operators.update(self.operators)
+            other.methods.update(self.methods)
+            other.lower_bound = self.lower_bound
+        return other
+
+    def declare_operators(self, *op_list):
+        """
+        Call this after defining the operators, to tell Pyhop what they are.
+        op_list must be a list of functions, not strings.
+        """
+        for op in op_list:
+            if not callable(op):
+                raise ValueError(f"Operator {op} is not callable")
+        with self._lock:
+            for op in op_list:
+                self.operators[op.__name__] = op
+        return self.operators
+
+    def declare_methods(self, task_name, *method_list):
+        """
+        Call this once for each task, to tell Pyhop what the methods are.
+        task_name must be a string.
+        method_list must be a list of functions, not strings.
+        """
+        if not isinstance(task_name, str):
+            raise ValueError("Task name must be a string")
+        for method in method_list:
+            if not callable(method):
+                raise ValueError(f"Method {method} is not callable")
+        with self._lock:
+            self.methods[task_name] = list(method_list)
+        return self.methods[task_name]
+
+    def declare_lower_bound(self, func):
+        """
+        Tell Pyhop that func(state, tasks) is a lower bound on the final cost
+        (as with pyhop's optimize) of any plan that accomplishes tasks from
+        state, or math.inf if no plan can. tasks iterates over the remaining
+        tasks in order, so func can stop looking early. None removes it.
+        """
+        if func is not None and not callable(func):
+            raise ValueError(f"Lower bound {func} is not callable")
+        self.lower_bound = func
+        return func
+
+    def pyhop(self, state, tasks, verbose=0, **options):
+        """Like pyhop, with the operators, methods and params of this planner."""
+        token = _active.set(self)
+        try:
+            return pyhop(state, tasks, verbose, **options)
+        finally:
+            _active.reset(token)
+
+    async def pyhop_async(self, state, tasks, **options):
+        """Like pyhop_async, with the operators, methods and params of this planner."""
+        token = _active.set(self)
+        try:
+            return await pyhop_async(state, tasks, **options)
+        finally:
+            _active.reset(token)
+
+    def print_operators(self):
+        print_operators(self.operators)
+
+    def print_methods(self):
+        print_methods(self.methods)
+
+    def __repr__(self):
+        return f"Planner({self.params!r})"
+
+    def __getstate__(self):
+        # sent to worker processes without its lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+default_planner = Planner()
+operators = default_planner.operators
+methods = default_planner.methods
+
+# the planner whose pyhop is running in this thread or task
+_active = contextvars.ContextVar('pyhop_planner', default=default_planner)
+
+
+def current_planner():
+    """Return the planner that is searching (default_planner outside of Planner.pyhop)."""
+    return _active.get()
+
+
+def active_params():
+    """Return the params of the planner that is searching."""
+    return _active.get().params
+
+
+def declare_operators(*op_list):
+    """Declare operators in default_planner (see Planner.declare_operators)."""
+    return default_planner.declare_operators(*op_list)
 
 
 def declare_methods(task_name, *method_list):
-    """
-    Call this once for each task, to tell Pyhop what the methods are.
-    task_name must be a string.
-    method_list must be a list of functions, not strings.
-    """
-    if not isinstance(task_name, str):
-        raise ValueError("Task name must be a string")
-    for method in method_list:
-        if not callable(method):
-            raise ValueError(f"Method {method} is not callable")
-    methods[task_name] = list(method_list)
-    return methods[task_name]
+    """Declare methods in default_planner (see Planner.declare_methods)."""
+    return default_planner.declare_methods(task_name, *method_list)
+
+
+def declare_lower_bound(func):
+    """Declare the lower bound of default_planner (see Planner.declare_lower_bound)."""
+    return default_planner.declare_lower_bound(func)
 
 
 ############################################################
@@ -226,17 +1042,470 @@ def print_methods(mlist=methods):
         print(f"{task:<{max_task_length + 1}}{'| '}{', '.join(f.__name__ for f in mlist[task])}")
 
 
+############################################################
+# Remembering failed search nodes
+
+def _cells_hash(cells):
+    """Hash a chain of cells, caching the hash in each cell (tails first)."""
+    pending = []
+    while cells is not None and cells.hash is None:
+        pending.append(cells)
+        cells = cells.tail
+    value = 0 if cells is None else cells.hash
+    for cell in reversed(pending):
+        value = cell.hash = hash((cell.head, value))
+    return value
+
+
+def _cells_equal(cells1, cells2):
+    """Compare two chains of cells item by item, stopping at a shared tail."""
+    while cells1 is not cells2:
+        if cells1 is None or cells2 is None or cells1.head != cells2.head:
+            return False
+        cells1 = cells1.tail
+        cells2 = cells2.tail
+    return True
+
+
+def _snapshot(state):
+    """
+    Return a copy of state that later writes to state do not change. In
+    trail mode the search keeps writing to state itself, so its dicts are
+    copied: sharing them (state.copy()) would make state clone each one
+    on its next write, as if every node were copied.
+    """
+    if state._trail is None:
+        return state.copy()
+    snapshot = State.__new__(State)
+    snapshot._trail = None
+    snapshot._hash = state._hash
+    fields = snapshot.__dict__
+    for name, val in state.__dict__.items():
+        if type(val) is CowDict:
+            data = val
+            val = CowDict(data._data.copy())
+            val._hash = data._hash
+        fields[name] = val
+    return snapshot
+
+
+class _NodeKey:
+    """Canonical (state, remaining tasks) pair of a search node."""
+
+    __slots__ = ('state', 'tasks', 'hash')
+
+    def __init__(self, state, tasks):
+        if isinstance(state, State):
+            # hash the live state first: its hash is then kept up to date on
+            # write and handed on to its copies, this snapshot included
+            state_hash = hash(state)
+            self.state = _snapshot(state)
+        else:
+            self.state = _freeze(state)
+            state_hash = hash(self.state)
+        self.tasks = tasks
+        self.hash = hash((state_hash, _cells_hash(tasks)))
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return (self.hash == other.hash and _cells_equal(self.tasks, other.tasks)
+                and self.state == other.state)
+
+
+class TranspositionTable:
+    """
+    Set of search nodes (state, remaining tasks) known to have no plan.
+    - max_entries caps the number of nodes kept; when it is reached the
+      least recently used node is forgotten.
+    - bloom_bits, if given, is the initial size of a Bloom filter that is
+      checked before the table itself, so most lookups of new nodes stop
+      there. The filter doubles in size when it gets too full.
+    hits, stores and evictions count what the table has done.
+    """
+
+    def __init__(self, max_entries=100000, bloom_bits=None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.failed = OrderedDict()
+        self.bloom = bytearray((bloom_bits + 7) // 8) if bloom_bits else None
+        self.bloom_bits = bloom_bits
+        self.bloom_items = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.failed)
+
+    def _bloom_bits_of(self, key):
+        value = key.hash & 0xFFFFFFFFFFFFFFFF
+        step = (value >> 32) | 1
+        for i in range(3):
+            yield (value + i * step) % self.bloom_bits
+
+    def _bloom_add(self, key):
+        for bit in self._bloom_bits_of(key):
+            self.bloom[bit >> 3] |= 1 << (bit & 7)
+        self.bloom_items += 1
+        # forgotten nodes stay in the filter; rebuild it before it fills up,
+        # growing it until the live nodes fill at most half of its capacity
+        # so that the next rebuild is at least as many adds away
+        if self.bloom_items > self.bloom_bits // 5:
+            while len(self.failed) > self.bloom_bits // 10:
+                self.bloom_bits *= 2
+            self.bloom = bytearray((self.bloom_bits + 7) // 8)
+            self.bloom_items = 0
+            for old_key in self.failed:
+                for bit in self._bloom_bits_of(old_key):
+                    self.bloom[bit >> 3] |= 1 << (bit & 7)
+                self.bloom_items += 1
+
+    def key(self, state, tasks):
+        """Return the key of a search node (tasks is a chain of cells)."""
+        return _NodeKey(state, tasks)
+
+    def __contains__(self, key):
+        if self.bloom is not None:
+            for bit in self._bloom_bits_of(key):
+                if not self.bloom[bit >> 3] & (1 << (bit & 7)):
+                    return False
+        if key in self.failed:
+            self.failed.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, key):
+        """Record that the node with this key has no plan."""
+        self.failed[key] = None
+        self.failed.move_to_end(key)
+        self.stores += 1
+        if self.bloom is not None:
+            self._bloom_add(key)
+        if len(self.failed) > self.max_entries:
+            self.failed.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.failed.clear()
+        if self.bloom is not None:
+            self.bloom = bytearray(len(self.bloom))
+            self.bloom_items = 0
+
+
+############################################################
+# Search statistics
+
+class SearchStats:
+    """
+    Counters of a search, filled in by pyhop(..., stats=...). They add up
+    over several searches until reset() is called.
+    - nodes: search nodes expanded; backtracks: nodes all of whose
+      alternatives failed; pruned: nodes cut off without being expanded
+      (known failures or, when optimizing, nodes over the cost bound)
+    - solutions: plans found; timeouts: searches stopped by their deadline
+    - max_depth: deepest node reached
+    - operators / methods: name -> [successes, failures]
+    - copy_time: seconds spent copying states; domain_time: seconds spent
+      in operators and methods; wall_time: seconds spent searching
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.pruned = 0
+        self.solutions = 0
+        self.timeouts = 0
+        self.max_depth = 0
+        self.operators = {}
+        self.methods = {}
+        self.copy_time = 0.0
+        self.domain_time = 0.0
+        self.wall_time = 0.0
+
+    def count(self, table, name, success):
+        counts = table.get(name)
+        if counts is None:
+            counts = table[name] = [0, 0]
+        counts[0 if success else 1] += 1
+
+    def as_dict(self):
+        """Return the counters as a flat dict of numbers."""
+        result = {name: getattr(self, name) for name in (
+            'nodes', 'backtracks', 'pruned', 'solutions', 'timeouts', 'max_depth', 'copy_time', 'domain_time', 'wall_time')}
+        for kind, table in (('operator', self.operators), ('method', self.methods)):
+            for name, (successes, failures) in table.items():
+                result[f'{kind}.{name}.successes'] = successes
+                result[f'{kind}.{name}.failures'] = failures
+        return result
+
+    def __repr__(self):
+        return f"SearchStats({', '.join(f'{key}={val}' for key, val in self.as_dict().items())})"
+
+
+############################################################
+# Tracing
+
+class TraceEvent:
+    """
+    One step of the search, passed to the trace subscriber.
+    - kind: 'expand', 'operator', 'decompose', 'method', 'backtrack',
+      'pruned', 'bounded' (over the cost bound) or 'solution'
+    - depth: depth of the search node
+    - task: the task being worked on (None for 'expand', 'pruned',
+      'bounded' and 'solution')
+    - data: the raw details: the remaining tasks ('expand', 'pruned',
+      'bounded'),
+      the new state or False ('operator'), (method, subtasks or False)
+      ('method'), or the plan ('solution')
+    - changes: for an applied 'operator', the changes it made to the
+      state (see state_changes)
+    The state the event refers to keeps changing after the subscriber
+    returns, so anything a subscriber keeps must be formatted right away.
+    """
+
+    __slots__ = ('kind', 'depth', 'task', 'data', 'changes')
+
+    def __init__(self, kind, depth, task=None, data=None, changes=None):
+        self.kind = kind
+        self.depth = depth
+        self.task = task
+        self.data = data
+        self.changes = changes
+
+    def payload(self, state=False):
+        """Return the event as a dict of plain values; state=True adds the state for 'operator'."""
+        result = {'kind': self.kind, 'depth': self.depth}
+        if self.task is not None:
+            result['task'] = list(self.task)
+        if self.kind in ('expand', 'pruned', 'bounded'):
+            result['tasks'] = [list(task) for task in _iter_cells(self.data)]
+        elif self.kind == 'operator':
+            result['applied'] = bool(self.data)
+            if self.changes is not None:
+                result['changes'] = [_change_string(change) for change in self.changes]
+            if state:
+                result['state'] = to_string(self.data)
+        elif self.kind == 'method':
+            method, subtasks = self.data
+            result['method'] = method.__name__
+            result['chosen'] = subtasks is not False
+            if subtasks is not False:
+                result['subtasks'] = [list(task) for task in subtasks]
+        elif self.kind == 'solution':
+            result['plan'] = [list(task) for task in self.data]
+        return result
+
+    def __str__(self):
+        return json.dumps(self.payload(), default=repr)
+
+    def __repr__(self):
+        return f"TraceEvent({self.kind!r}, {self.depth}, {self.task!r})"
+
+
+class PrintSink:
+    """
+    Trace subscriber that prints events the way pyhop's verbose = 2 or 3
+    does. With diff=True, only the changes of each new state are printed.
+    """
+
+    def __init__(self, verbose=3, diff=False):
+        self.verbose = verbose
+        self.diff = diff
+
+    def __call__(self, event):
+        kind, depth = event.kind, event.depth
+        if kind == 'expand':
+            if self.verbose > 1:
+                print(f'depth {depth} tasks {list(_iter_cells(event.data))}')
+        elif self.verbose <= 2:
+            return
+        elif kind == 'operator':
+            print(f'depth {depth} action {event.task}')
+            print(f'depth {depth} new state:')
+            print_state(event.data, diff=event.changes if self.diff else None)
+        elif kind == 'decompose':
+            print(f'depth {depth} method instance {event.task}')
+        elif kind == 'method':
+            print(f'depth {depth} new tasks: {event.data[1]}')
+        elif kind == 'backtrack':
+            print(f'depth {depth} returns failure')
+        elif kind == 'pruned':
+            print(f'depth {depth} known failure')
+        elif kind == 'bounded':
+            print(f'depth {depth} over cost bound')
+        elif kind == 'solution':
+            print(f'depth {depth} returns plan {event.data}')
+
+
+class JsonLinesSink:
+    """
+    Trace subscriber that writes each event as one JSON line to stream.
+    Lines are buffered and written buffer_size at a time; call flush() or
+    close() (or use it in a with statement) when the search is over.
+    kinds, if given, is the set of event kinds to keep; states=True adds
+    the new state to 'operator' events.
+    """
+
+    def __init__(self, stream, buffer_size=1000, kinds=None, states=False):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.kinds = None if kinds is None else frozenset(kinds)
+        self.states = states
+        self.buffer = []
+
+    def __call__(self, event):
+        if self.kinds is not None and event.kind not in self.kinds:
+            return
+        self.buffer.append(json.dumps(event.payload(self.states), default=repr))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SamplingSink:
+    """
+    Trace subscriber that passes on to sink a random fraction rate of the
+    events, plus every event whose kind is in always.
+    """
+
+    def __init__(self, sink, rate=0.01, always=('solution',), seed=None):
+        self.sink = sink
+        self.rate = rate
+        self.always = frozenset(always)
+        self.random = random.Random(seed).random
+
+    def __call__(self, event):
+        if event.kind in self.always or self.random() < self.rate:
+            self.sink(event)
+
+
+def _tracer(verbose, trace):
+    """Return the subscriber for verbose printing and/or the trace given."""
+    if verbose > 1:
+        printer = PrintSink(verbose)
+        if trace is None:
+            return printer
+
+        def both(event):
+            printer(event)
+            trace(event)
+        return both
+    return trace
+
+
 ############################################################
 # The actual planner
 
-def pyhop(state, tasks, verbose=0):
+def copy_state(state):
+    """
+    Return a copy of state that an operator may modify. States use the
+    cheap copy-on-write State.copy; anything else is deep-copied.
+    """
+    if isinstance(state, State):
+        return state.copy()
+    return copy.deepcopy(state)
+
+
+class BudgetExhausted:
+    """
+    What pyhop returns when its deadline, max_nodes or stop function stops
+    the search, and pyhop_async when one of its budgets does: the plan it
+    holds, if any, is only the best one found so far. It is false, like
+    the [] that pyhop returns when there is no plan.
+    - reason: 'deadline', 'nodes', 'memory' or 'stopped'
+    - stats: the SearchStats of the search, or None if it had none
+    - best: the best [plan, state] found before stopping, or None
+    """
+
+    def __init__(self, reason, stats, best=None):
+        self.reason = reason
+        self.stats = stats
+        self.best = best
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        nodes = '' if self.stats is None else f", nodes={self.stats.nodes}"
+        return f"BudgetExhausted({self.reason!r}{nodes}, best={self.best is not None})"
+
+
+def pyhop(state, tasks, verbose=0, mode='copy', table=None, stats=None, trace=None,
+          optimize=False, deadline=None, workers=None, deterministic=False, stop=None, params=None,
+          max_nodes=None):
     """
     Try to find a plan that accomplishes tasks in state. 
     If successful, return the plan. Otherwise return False.
+    mode is 'copy' (each operator gets a copy of the state) or 'trail'
+    (one state is modified in place and writes are undone on backtracking).
+    table is an optional TranspositionTable of nodes known to fail; the
+    tasks must then be hashable. stats is an optional SearchStats to fill in.
+    trace is an optional subscriber called with each TraceEvent.
+    With optimize (True for state.cost, or a function giving the cost of a
+    state), return the cheapest plan instead of the first one. deadline
+    is a number of seconds after which the search stops and returns a
+    BudgetExhausted holding the best plan so far; max_nodes is a number
+    of search nodes after which it does the same.
+    stop, if given, is called now and then during the search; once it
+    returns true, the search stops and returns a BudgetExhausted too.
+    params, if given, override the params of the active planner (see
+    Planner) for this call only, e.g. params={'COST_BUS': 0}.
+    With workers, the search runs in that many processes (see
+    parallel_plan); deterministic then asks for the plan the one-process
+    search would return.
     """
+    if params:
+        token = _active.set(_active.get().variant(**params))
+        try:
+            return pyhop(state, tasks, verbose, mode, table, stats, trace, optimize, deadline,
+                         workers, deterministic, stop, max_nodes=max_nodes)
+        finally:
+            _active.reset(token)
+    if optimize is True:
+        optimize = _state_cost
+    if mode not in ('copy', 'trail'):
+        raise ValueError(f"Unknown planning mode {mode!r}")
+    if workers is not None and (mode != 'copy' or table is not None or stats is not None
+                                or trace is not None or optimize or stop is not None
+                                or max_nodes is not None):
+        raise ValueError("workers only works with mode='copy' and without table, stats, trace, "
+                         "optimize, stop or max_nodes")
     if verbose > 0:
         print(f'\n** pyhop, verbose={verbose}: **\n   state = {state}\n   tasks = {tasks}')
-    result_list = seek_plan(state, tasks, [], 0, verbose)
+    if workers is not None:
+        result_list = parallel_plan(state, tasks, workers, deterministic, deadline)
+    elif mode == 'trail':
+        if not isinstance(state, State):
+            raise TypeError("mode='trail' needs a pyhop.State")
+        state = state.copy()
+        set_trail(state, [])
+        result_list = seek_plan(state, tasks, [], 0, verbose, state._trail, table, stats, trace,
+                                optimize or None, deadline, stop, max_nodes)
+        set_trail(state, None)
+    else:
+        result_list = seek_plan(state, tasks, [], 0, verbose, table=table, stats=stats, trace=trace,
+                                cost=optimize or None, deadline=deadline, stop=stop, max_nodes=max_nodes)
     if verbose > 0:
         if not result_list:
             print('** result =', result_list, '\n')
@@ -245,48 +1514,652 @@ def pyhop(state, tasks, verbose=0):
             print('** final state =')
             print_state(result_list[1])
             print()
-    return result_list if result_list else []
+    return result_list if result_list is not False else []
 
 
-def seek_plan(state, tasks, plan, depth, verbose=0):
+def _state_cost(state):
+    return state.cost
+
+
+class _Cell:
+    """
+    One cell of an immutable linked list. seek_plan keeps the task agenda
+    and the partial plan (newest action first) as chains of cells, so
+    popping a task, pushing subtasks and extending the plan never copy the
+    part of the list that is shared with other search nodes.
+    """
+
+    __slots__ = ('head', 'tail', 'hash')
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+        self.hash = None
+
+
+def _push(items, cells):
+    """Return the cells of items (a list) followed by cells; O(len(items))."""
+    for item in reversed(items):
+        cells = _Cell(item, cells)
+    return cells
+
+
+def _iter_cells(cells):
+    """Iterate over the items of a chain of cells (None is the empty list)."""
+    while cells is not None:
+        yield cells.head
+        cells = cells.tail
+
+
+def _plan_list(plan):
+    """Turn a plan kept newest first into the list of actions, oldest first."""
+    actions = list(_iter_cells(plan))
+    actions.reverse()
+    return actions
+
+
+def seek_plan(state, tasks, plan, depth, verbose=0, trail=None, table=None, stats=None, trace=None,
+              cost=None, deadline=None, stop=None, max_nodes=None):
     """
     Workhorse for pyhop. state and tasks are as in pyhop.
     - plan is the current partial plan.
-    - depth is the recursion depth, for use in debugging
+    - depth is the search depth, for use in debugging
     - verbose is whether to print debugging messages
+    - trail, if given, is the undo trail of state: operators then modify
+      state in place and seek_plan undoes their writes when it fails
+    - table, if given, is a TranspositionTable: nodes found in it are
+      pruned and nodes whose alternatives all fail are added to it
+    - stats, if given, is a SearchStats to fill in
+    - trace, if given, is called with a TraceEvent for each search step
+    - cost, if given, is a function giving the cost of a state: the search
+      then goes on after each plan, prunes nodes that cost as much as the
+      best plan so far, and returns the cheapest plan
+    - deadline, if given, is a number of seconds after which the search
+      stops and returns a BudgetExhausted with the best plan found so far
+    - stop, if given, is called every few nodes; when it returns true the
+      search stops as at the deadline
+    - max_nodes, if given, is the number of nodes the search may expand;
+      it then stops as at the deadline
+    The search is a depth-first search over an explicit stack of choice
+    points (see expand), so plan length is not limited by Python's
+    recursion limit. Tasks and plan are kept as linked cells internally,
+    so each search node costs the same however long the plan already is.
     """
-    if verbose > 1:
-        print(f'depth {depth} tasks {tasks}')
-    if not tasks:
-        if verbose > 2:
-            print(f'depth {depth} returns plan {plan}')
-        return [plan, state]
-    task1 = tasks[0]
+    trace = _tracer(verbose, trace)
+    start = perf_counter()
+    if deadline is not None:
+        deadline += start
+    if stats is not None:
+        try:
+            return _search(state, tasks, plan, depth, trace, trail, table, stats, cost, deadline, stop,
+                           max_nodes)
+        finally:
+            stats.wall_time += perf_counter() - start
+    return _search(state, tasks, plan, depth, trace, trail, table, stats, cost, deadline, stop, max_nodes)
+
+
+# nodes expanded between two looks at the clock and the stop function
+_DEADLINE_CHECK = 64
+
+_INFINITY = float('inf')
+
+
+def _search(state, tasks, plan, depth, trace, trail, table, stats, cost, deadline, stop, max_nodes):
+    """
+    The depth-first search loop of seek_plan. When optimizing, a node only
+    goes into the table if its whole subtree failed on its own: subtrees
+    with a plan or a node over the cost bound are tainted, i.e. every key
+    below index tainted on the keys stack is not recorded.
+    """
+    best = False
+    planner = _active.get()
+    estimate = planner.lower_bound
+    tainted = 0
+    countdown = _DEADLINE_CHECK
+    tasks = _push(tasks, None)
+    if table is not None:
+        if tasks is not None and table.key(state, tasks) in table:
+            if stats is not None:
+                stats.pruned += 1
+            return False
+        keys = [table.key(state, tasks) if tasks is not None else None]
+    # nodes left to expand, checked on every node as it is one comparison
+    left = None if max_nodes is None else max_nodes - 1
+    if left is not None and left < 0:
+        return BudgetExhausted('nodes', stats)
+    if stats is not None:
+        stats.nodes += 1
+        stats.max_depth = max(stats.max_depth, depth)
+    stack = [expand(state, tasks, _push(plan[::-1], None), depth, trace, trail, stats, planner)]
+    while stack:
+        if deadline is not None or stop is not None:
+            countdown -= 1
+            if not countdown:
+                countdown = _DEADLINE_CHECK
+                if deadline is not None and perf_counter() > deadline:
+                    if stats is not None:
+                        stats.timeouts += 1
+                    return BudgetExhausted('deadline', stats, best or None)
+                if stop is not None and stop():
+                    return BudgetExhausted('stopped', stats, best or None)
+        child = next(stack[-1], None)
+        if child is None:
+            # every alternative of this choice point failed: backtrack
+            stack.pop()
+            if stats is not None:
+                stats.backtracks += 1
+            if table is not None:
+                key = keys.pop()
+                if len(keys) < tainted:
+                    tainted = len(keys)
+                elif key is not None:
+                    table.add(key)
+        elif child[0] is _SOLVED:
+            if stats is not None:
+                stats.solutions += 1
+            if cost is None:
+                return child[1]
+            # in trail mode the state goes on changing: keep a snapshot
+            found, final = child[1]
+            best = [found, final.copy() if trail is not None else final]
+            bound = cost(final)
+            if table is not None:
+                tainted = len(keys)
+        else:
+            if estimate is not None:
+                floor = estimate(child[0], _iter_cells(child[1]))
+                # math.inf is a failure on its own, not because of the bound
+                hopeless = floor == _INFINITY
+            else:
+                floor, hopeless = None, False
+            if hopeless or best and (cost(child[0]) >= bound or floor is not None and floor >= bound):
+                if trace is not None:
+                    trace(TraceEvent('bounded', child[3], None, child[1]))
+                if stats is not None:
+                    stats.pruned += 1
+                if table is not None and not hopeless:
+                    tainted = len(keys)
+                continue
+            if table is not None:
+                key = None
+                if child[1] is not None:
+                    key = table.key(child[0], child[1])
+                    if key in table:
+                        if trace is not None:
+                            trace(TraceEvent('pruned', child[3], None, child[1]))
+                        if stats is not None:
+                            stats.pruned += 1
+                        continue
+                keys.append(key)
+            if left is not None:
+                if not left:
+                    return BudgetExhausted('nodes', stats, best or None)
+                left -= 1
+            if stats is not None:
+                stats.nodes += 1
+                if child[3] > stats.max_depth:
+                    stats.max_depth = child[3]
+            stack.append(expand(*child, trace, trail, stats, planner))
+    return best
+
+
+# first item of what expand yields when it has found a plan
+_SOLVED = object()
+
+
+def apply_operator(operator, state, args, trail=None, stats=None, changes=None):
+    """
+    Apply operator to state with arguments args and return the new state,
+    or False if the operator does not apply. Without a trail, operator
+    gets a copy of state; an Operator is copied for only if it applies.
+    If changes is a list, the changes the operator made are added to it
+    (see state_changes).
+    """
+    in_place = trail is not None
+    if changes is not None:
+        # a copy records its writes on a trail of its own
+        if not in_place:
+            trail = []
+        mark = len(trail)
+    timed = stats is not None
+    if timed:
+        start = perf_counter()
+    if type(operator) is Operator:
+        # check before copying; the effects are computed on this state
+        if not operator.applicable(state, *args):
+            newstate = False
+        else:
+            effects = operator.effects(state, *args)
+            if not in_place:
+                if timed:
+                    copied = perf_counter()
+                    stats.domain_time += copied - start
+                state = copy_state(state)
+                if timed:
+                    start = perf_counter()
+                    stats.copy_time += start - copied
+                if trail is not None:
+                    set_trail(state, trail)
+            newstate = apply_effects(state, effects)
+    elif not in_place:
+        newstate = copy_state(state)
+        if timed:
+            copied = perf_counter()
+            stats.copy_time += copied - start
+            start = copied
+        if trail is not None:
+            set_trail(newstate, trail)
+        newstate = operator(newstate, *args)
+    else:
+        newstate = operator(state, *args)
+        if newstate and newstate is not state:
+            raise ValueError(f"Operator {operator.__name__} must modify and return the state it gets in mode='trail'")
+    if timed:
+        stats.domain_time += perf_counter() - start
+        stats.count(stats.operators, operator.__name__, bool(newstate))
+    if changes is not None and newstate:
+        changes.extend(state_changes(newstate, trail[mark:]))
+        if not in_place:
+            set_trail(newstate, None)
+    return newstate
+
+
+def expand(state, tasks, plan, depth, trace=None, trail=None, stats=None, planner=None):
+    """
+    Generate the children of one search node as (state, tasks, plan, depth)
+    tuples, in the order seek_plan tries them: first the operator for the
+    first task, then each of its methods. tasks and plan are chains of
+    _Cell (plan newest first, None when empty). For an empty task list it
+    yields (_SOLVED, [plan, state]) instead, with plan as a list. With a
+    trail, the writes of the operator are undone when the search comes
+    back to this node. With stats, operator and method calls are counted
+    and timed. trace, if given, is called with a TraceEvent for each step.
+    Operators and methods come from planner (default: the active one).
+    """
+    if planner is None:
+        planner = _active.get()
+    operators, methods = planner.operators, planner.methods
+    if trace is not None:
+        trace(TraceEvent('expand', depth, None, tasks))
+    if tasks is None:
+        plan = _plan_list(plan)
+        if trace is not None:
+            trace(TraceEvent('solution', depth, None, plan))
+        yield _SOLVED, [plan, state]
+        return
+    task1 = tasks.head
     if task1[0] in operators:
-        if verbose > 2:
-            print(f'depth {depth} action {task1}')
-        operator = operators[task1[0]]
-        newstate = operator(copy.deepcopy(state), *task1[1:])
-        if verbose > 2:
-            print(f'depth {depth} new state:')
-            print_state(newstate)
+        if trail is not None:
+            mark = len(trail)
+        if trace is None:
+            newstate = apply_operator(operators[task1[0]], state, task1[1:], trail, stats)
+        else:
+            changes = []
+            newstate = apply_operator(operators[task1[0]], state, task1[1:], trail, stats, changes)
+            trace(TraceEvent('operator', depth, task1, newstate, changes if newstate else None))
         if newstate:
-            solution_list = seek_plan(newstate, tasks[1:], plan + [task1], depth + 1, verbose)
-            if solution_list:
-                return solution_list
+            yield newstate, tasks.tail, _Cell(task1, plan), depth + 1
+        if trail is not None:
+            undo_trail(trail, mark)
     if task1[0] in methods:
-        if verbose > 2:
-            print(f'depth {depth} method instance {task1}')
+        if trace is not None:
+            trace(TraceEvent('decompose', depth, task1))
         relevant = methods[task1[0]]
         for method in relevant:
-            subtasks = method(state, *task1[1:])
+            if stats is None:
+                subtasks = method(state, *task1[1:])
+            else:
+                start = perf_counter()
+                subtasks = method(state, *task1[1:])
+                stats.domain_time += perf_counter() - start
+                stats.count(stats.methods, method.__name__, subtasks is not False)
+            if trace is not None:
+                trace(TraceEvent('method', depth, task1, (method, subtasks)))
             # Can't just say "if subtasks:", because that's wrong if subtasks == []
-            if verbose > 2:
-                print(f'depth {depth} new tasks: {subtasks}')
             if subtasks is not False:
-                solution_list = seek_plan(state, subtasks + tasks[1:], plan, depth + 1, verbose)
-                if solution_list:
-                    return solution_list
-    if verbose > 2:
-        print(f'depth {depth} returns failure')
-    return False
\ No newline at end of file
+                yield state, _push(subtasks, tasks.tail), plan, depth + 1
+    if trace is not None:
+        trace(TraceEvent('backtrack', depth, task1))
+
+
+############################################################
+# Parallel search
+
+# nodes a worker expands between two looks at the other workers
+_SHARE_CHECK = 64
+
+# seconds the coordinator waits for a message before checking on the workers
+_POLL = 0.1
+
+
+class _RemoteTraceback(Exception):
+    """Traceback of an exception raised in a worker process, set as its cause."""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+def parallel_plan(state, tasks, workers, deterministic=False, deadline=None):
+    """
+    Search for a plan with workers processes; return [plan, state] or False.
+    A work unit is a search node with the path that leads to it from the
+    root: the index of the alternative taken at each choice point. Paths
+    sort in the order the one-process search visits nodes, so with
+    deterministic=True the first plan is only returned once every unit
+    with a smaller path has been searched. deadline is as in seek_plan.
+    An exception raised in a worker is raised again here, and a worker
+    that dies without reporting raises RuntimeError.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    context = multiprocessing.get_context()
+    units = context.Queue()
+    results = context.Queue()
+    hungry = context.Value('i', 0)
+    cancel = context.Event()
+    controls = [context.Queue() for _ in range(workers)]
+    _put(units, ((), state, list(tasks), [], 0))
+    planner = _active.get()
+    processes = [context.Process(target=_worker, args=(units, results, hungry, cancel, control, planner),
+                                 daemon=True)
+                 for control in controls]
+    for process in processes:
+        process.start()
+    # units not searched yet, and units reported searched before being reported created
+    pending = {()}
+    finished = set()
+    best = None
+    end = None if deadline is None else perf_counter() + deadline
+    # a worker seen dead; its last messages get one more poll to arrive
+    dead = None
+    try:
+        while True:
+            if best is not None and (not deterministic or not any(path < best[0] for path in pending)):
+                return best[1]
+            if not pending:
+                return False
+            timeout = _POLL
+            if end is not None:
+                timeout = min(timeout, end - perf_counter())
+                if timeout <= 0:
+                    return BudgetExhausted('deadline', None, best[1] if best is not None else None)
+            try:
+                message = pickle.loads(results.get(timeout=timeout))
+            except Empty:
+                # workers only exit on cancel, so an exit here is a crash
+                if dead is not None:
+                    raise RuntimeError(f"a worker process exited with code {dead.exitcode} "
+                                       "without reporting its work") from None
+                dead = next((process for process in processes if process.exitcode is not None), None)
+                continue
+            kind, path = message[0], message[1]
+            if kind == 'error':
+                raise message[2] from _RemoteTraceback(message[3])
+            if kind == 'spawned':
+                if path in finished:
+                    finished.discard(path)
+                else:
+                    pending.add(path)
+            else:
+                if path in pending:
+                    pending.discard(path)
+                else:
+                    finished.add(path)
+                if kind == 'solved' and (best is None or message[2] < best[0]):
+                    best = message[2], message[3]
+                    # workers can drop whatever comes after this plan
+                    for control in controls:
+                        control.put(best[0])
+    finally:
+        cancel.set()
+        for process in processes:
+            process.join(1)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+
+def _worker(units, results, hungry, cancel, control, planner):
+    """Take work units from units and search them until cancel is set."""
+    # domain code asks for the planner with active_params()
+    _active.set(planner)
+    best = None
+    while True:
+        with hungry.get_lock():
+            hungry.value += 1
+        unit = None
+        while unit is None:
+            if cancel.is_set():
+                return
+            try:
+                unit = pickle.loads(units.get(timeout=0.05))
+            except Empty:
+                pass
+        with hungry.get_lock():
+            hungry.value -= 1
+        best = _latest(control, best)
+        if best is not None and unit[0] > best:
+            _put(results, ('done', unit[0]))
+            continue
+        try:
+            _search_unit(*unit, units, results, hungry, cancel, control, best, planner)
+        except Exception as error:
+            text = traceback.format_exc()
+            try:
+                pickle.dumps(error)
+            except Exception:
+                error = RuntimeError(repr(error))
+            _put(results, ('error', unit[0], error, text))
+            return
+
+
+def _put(queue, message):
+    """
+    Put message on queue pickled. A queue pickles in a background thread,
+    where an error is only printed and the message lost; pickling here
+    raises it in the caller instead.
+    """
+    queue.put(pickle.dumps(message))
+
+
+def _latest(control, best):
+    """Return the last plan path put on control, or best if there is none."""
+    while True:
+        try:
+            best = control.get_nowait()
+        except Empty:
+            return best
+
+
+def _search_unit(path, state, tasks, plan, depth, units, results, hungry, cancel, control, best, planner):
+    """
+    Depth-first search of one work unit, reporting to results. current[k]
+    is the index of the alternative of stack[k] being searched and
+    yielded[k] how many alternatives stack[k] has produced so far.
+    """
+    estimate = planner.lower_bound
+    stack = [expand(state, _push(tasks, None), _push(plan[::-1], None), depth, planner=planner)]
+    current = []
+    yielded = [0]
+    # choice points above this one have no alternatives left to give away
+    shared = 0
+    countdown = _SHARE_CHECK
+    while stack:
+        countdown -= 1
+        if not countdown:
+            countdown = _SHARE_CHECK
+            if cancel.is_set():
+                return
+            best = _latest(control, best)
+            if best is not None and path + tuple(current) > best:
+                # everything left in this unit comes after the plan found
+                break
+            if hungry.value > 0:
+                shared = _share(path, stack, current, yielded, shared, units, results)
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            yielded.pop()
+            if current:
+                current.pop()
+            shared = min(shared, len(stack))
+            continue
+        index = yielded[-1]
+        yielded[-1] += 1
+        if child[0] is _SOLVED:
+            _put(results, ('solved', path, path + tuple(current) + (index,), child[1]))
+            return
+        if estimate is not None and estimate(child[0], _iter_cells(child[1])) == _INFINITY:
+            continue
+        current.append(index)
+        yielded.append(0)
+        stack.append(expand(*child, planner=planner))
+    _put(results, ('done', path))
+
+
+def _share(path, stack, current, yielded, shared, units, results):
+    """
+    Give away the next alternative of the shallowest choice point that has
+    one, as a new work unit; return the new value of shared. Creation is
+    reported before the unit is queued, and so before this worker reports
+    its own unit searched.
+    """
+    for level in range(shared, len(stack) - 1):
+        child = next(stack[level], None)
+        if child is None:
+            shared = level + 1
+            continue
+        index = yielded[level]
+        yielded[level] += 1
+        unit_path = path + tuple(current[:level]) + (index,)
+        _put(results, ('spawned', unit_path))
+        _put(units, (unit_path, child[0], list(_iter_cells(child[1])), _plan_list(child[2]), child[3]))
+        break
+    return shared
+
+
+def plan_batch(problems, domain, workers=None, ordered=True, chunksize=1, max_in_flight=None,
+               **options):
+    """
+    Solve each (state, tasks) pair of problems with pyhop(state, tasks,
+    **options) on a pool of workers processes (default: one per CPU),
+    each of which imports the module named domain once to declare the
+    operators and methods. Yield (index, result) for each problem, where
+    result is what pyhop returns: in the order of problems if ordered,
+    otherwise as soon as their chunk is done. Problems go to the workers
+    chunksize at a time; at most max_in_flight chunks (default: twice the
+    number of workers) are waiting or running at once. The workers plan
+    with their default_planner.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    with ProcessPoolExecutor(workers, initializer=importlib.import_module,
+                             initargs=(domain,)) as pool:
+        chunks = _chunks(problems, chunksize)
+        in_flight = deque()
+        start = 0
+        for chunk in chunks:
+            in_flight.append((start, pool.submit(_plan_chunk, chunk, options)))
+            start += len(chunk)
+            if len(in_flight) >= max_in_flight:
+                break
+        while in_flight:
+            if ordered:
+                done = [in_flight.popleft()]
+            else:
+                finished, _ = wait([future for _, future in in_flight], return_when=FIRST_COMPLETED)
+                done = [item for item in in_flight if item[1] in finished]
+                for item in done:
+                    in_flight.remove(item)
+            for first, future in done:
+                for offset, result in enumerate(future.result()):
+                    yield first + offset, result
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    in_flight.append((start, pool.submit(_plan_chunk, chunk, options)))
+                    start += len(chunk)
+
+
+def _chunks(problems, chunksize):
+    """Iterate over problems as lists of chunksize pairs (the last one may be shorter)."""
+    chunk = []
+    for problem in problems:
+        chunk.append(problem)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _plan_chunk(chunk, options):
+    return [pyhop(state, tasks, **options) for state, tasks in chunk]
+
+
+############################################################
+# Planning from asyncio
+
+class _Budget:
+    """The stop function of pyhop_async: it sets reason when it fires."""
+
+    def __init__(self, deadline, max_memory):
+        self.deadline = None if deadline is None else perf_counter() + deadline
+        # memory may be in use by earlier work: count from here
+        self.max_memory = None if max_memory is None else _resident_memory() + max_memory
+        self.cancelled = threading.Event()
+        self.reason = None
+
+    def __call__(self):
+        if self.cancelled.is_set():
+            self.reason = 'cancelled'
+        elif self.deadline is not None and perf_counter() > self.deadline:
+            self.reason = 'deadline'
+        elif self.max_memory is not None and _resident_memory() > self.max_memory:
+            self.reason = 'memory'
+        return self.reason is not None
+
+
+_STATM = '/proc/self/statm'
+
+
+def _resident_memory():
+    """Memory this process has resident now, in bytes."""
+    with open(_STATM) as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+async def pyhop_async(state, tasks, deadline=None, max_nodes=None, max_memory=None, **options):
+    """
+    Run pyhop(state, tasks, **options) in a worker thread and return its
+    result. The search stops early after deadline seconds, after max_nodes
+    search nodes, or once the resident memory of the process has grown by
+    max_memory bytes since the call, and then returns a BudgetExhausted.
+    Cancelling the awaiting task stops the search too. options may include
+    stats to fill in, but not workers.
+    """
+    if max_memory is not None and not os.path.exists(_STATM):
+        raise ValueError(f"max_memory needs {_STATM}")
+    if options.get('stats') is None:
+        options['stats'] = SearchStats()
+    budget = _Budget(deadline, max_memory)
+    loop = asyncio.get_running_loop()
+    # the thread searches with the planner that is active here
+    search = loop.run_in_executor(None, contextvars.copy_context().run,
+                                  lambda: pyhop(state, tasks, stop=budget, max_nodes=max_nodes, **options))
+    try:
+        result = await search
+    except asyncio.CancelledError:
+        budget.cancelled.set()
+        raise
+    if isinstance(result, BudgetExhausted) and result.reason == 'stopped':
+        # tell which budget stopped it
+        result.reason = budget.reason
+    return result
@@ -0,0 +1,136 @@
+# sweep.py
+"""
+Parameter sweep over the problem instances: for every combination of
+final_cost budget (limit_cost), walking cost, bus cost and instance, plan
+and record whether there is a plan, its cost and length, whether the
+search hit its deadline, the nodes expanded and the time taken. Results are written as a CSV table.
+
+Example:
+    python sweep.py --limits 0 2 4 6 8 10 --walk 1 2 --bus 0 3 --output sweep.csv
+
+Combinations that only differ in the budget are solved together, from
+the tightest budget up. When searching for the cheapest plan (the
+default), a plan that is cheapest within a budget is also cheapest
+within every looser one, so it is reused instead of searching again.
+"""
+import argparse
+import csv
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import pyhop
+import domain
+
+# instance name -> problem.py-style file with a build() function
+INSTANCES = {
+    'base': 'problem.py',
+    'instancia1': os.path.join('ampliación instancia1', 'problem.py'),
+    'instancia2': os.path.join('ampliación instancia2', 'problem.py'),
+    'instancia3': os.path.join('ampliación instancia3', 'problem.py'),
+}
+
+COLUMNS = ('instance', 'limit_cost', 'cost_walk', 'cost_bus', 'feasible', 'plan_cost',
+           'plan_length', 'timed_out', 'nodes', 'seconds', 'reused')
+
+
+def load_builder(instance):
+    """Return the build() function of the problem file of instance."""
+    path = os.path.join(ROOT, INSTANCES[instance])
+    spec = importlib.util.spec_from_file_location(f'sweep_{instance}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.build
+
+
+def with_budget(tasks, limit_cost):
+    """Return tasks with the budget of its ('final_cost', N) task set to limit_cost."""
+    return [('final_cost', limit_cost) if task[0] == 'final_cost' else task for task in tasks]
+
+
+def solve_group(instance, cost_walk, cost_bus, limits, optimize=True, deadline=None):
+    """
+    Plan instance with the given costs for each budget in limits and return
+    one result row (a dict, see COLUMNS) per budget, tightest first.
+    """
+    state, tasks = load_builder(instance)()
+    params = {'cost_model': domain.CostModel(cost_walk, cost_bus)}
+    rows = []
+    known = None
+    for limit_cost in sorted(limits):
+        row = {'instance': instance, 'limit_cost': limit_cost,
+               'cost_walk': cost_walk, 'cost_bus': cost_bus}
+        if known is not None:
+            # the cheapest plan within a tighter budget is still the cheapest
+            row.update(known, nodes=0, seconds=0.0, reused=True)
+            rows.append(row)
+            continue
+        stats = pyhop.SearchStats()
+        start = perf_counter()
+        result = pyhop.pyhop(state, with_budget(tasks, limit_cost), stats=stats,
+                             optimize=optimize, deadline=deadline, params=params)
+        timed_out = isinstance(result, pyhop.BudgetExhausted)
+        if timed_out:
+            # the best plan by the deadline: feasible, but maybe not the cheapest
+            result = result.best
+        outcome = {'feasible': bool(result),
+                   'plan_cost': result[1].cost if result else None,
+                   'plan_length': len(result[0]) if result else None,
+                   'timed_out': timed_out}
+        row.update(outcome, nodes=stats.nodes, seconds=perf_counter() - start, reused=False)
+        rows.append(row)
+        if result and optimize and not timed_out:
+            known = outcome
+    return rows
+
+
+def sweep(limits, walk_costs, bus_costs, instances, workers=None, optimize=True, deadline=None):
+    """
+    Solve every combination of the grid on a pool of workers processes and
+    return the result rows, sorted by instance, costs and budget.
+    """
+    groups = [(instance, cost_walk, cost_bus)
+              for instance in instances for cost_walk in walk_costs for cost_bus in bus_costs]
+    rows = []
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(solve_group, *group, limits, optimize, deadline) for group in groups]
+        for future in futures:
+            rows.extend(future.result())
+    return rows
+
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='') as output:
+        writer = csv.DictWriter(output, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep budgets and travel costs over the instances.")
+    parser.add_argument('--limits', type=int, nargs='+', default=list(range(0, 16)),
+                        help="final_cost budgets (limit_cost) to try")
+    parser.add_argument('--walk', type=int, nargs='+', default=[domain.COST_WALK],
+                        help="walking costs to try")
+    parser.add_argument('--bus', type=int, nargs='+', default=[domain.COST_BUS],
+                        help="bus costs to try")
+    parser.add_argument('--instances', nargs='+', default=list(INSTANCES), choices=list(INSTANCES))
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--first-plan', action='store_true',
+                        help="take the first plan found instead of the cheapest (no reuse)")
+    parser.add_argument('--deadline', type=float, default=None, help="seconds allowed per search")
+    parser.add_argument('--output', default='sweep.csv', help="CSV file to write")
+    args = parser.parse_args(argv)
+    rows = sweep(args.limits, args.walk, args.bus, args.instances, args.workers,
+                 not args.first_plan, args.deadline)
+    write_csv(rows, args.output)
+    print(f"{len(rows)} results written to {args.output}")
+
+# execute sweep.py to run the sweep
+if __name__ == '__main__':
+    main()